@@ -50,6 +50,7 @@ def ConsoleIO(ecudata, controlQueue):
 		
 		print("*----------------------------------------*")
 		print("| Sample Count:   %6s                 |" % (ecudata.getCounter()))
+		print("| Sample Time:    %9.4fms            |" % (ecudata.getSampleTime()))
 		print("*========================================*")
 		
 		time.sleep(sleep_time)
@@ -150,6 +150,7 @@ def DataLoggerIO(ecudata, controlQueue, actionQueue):
 			cdata = ControlData()
 			cdata.button = settings.BUTTON_LOGGING_STATUS
 			cdata.destination = settings.BUTTON_DEST_ALL
+			cdata.setSource(myButtonId)
 			stats['status'] = logging
 			if logging and f:
 				f_stat = os.stat(settings.LOGGING_DIR + "/" + filename)
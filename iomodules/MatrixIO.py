@@ -19,10 +19,12 @@
 
 # Standard libraries
 import multiprocessing
+import logging
 import time
 import timeit
 import sys
 import os
+import copy
 
 # Settings file
 from libs import settings
@@ -40,6 +42,10 @@ from libs.EcuData import EcuData
 from libs.newlog import newlog
 logger = newlog(__name__)
 
+# Debug messages are logged for every row on every wake, so skip building
+# them unless they will actually be shown
+DEBUG_ON = logger.isEnabledFor(logging.DEBUG)
+
 def lcdWriteNumeric(lcd = None, ecudata = None, sensorId = None, previous = False, row = 1, peak = False):
 	""" Write a numeric sensor value """
 	if previous != False:
@@ -253,10 +259,10 @@ def MatrixIO(ecudata, datamanager):
 		logger.critical("This process will now exit")
 		exit(1)
 	
-	# Make a local copy of the matrix configuration data
-	local_matrix_config = {}
-	for k in ecudata.matrix_config.keys():
-		local_matrix_config[k] = ecudata.matrix_config[k]
+	# Make a local copy of the matrix configuration data - it is read only,
+	# so the per-row timers and state below are kept out of the original
+	local_matrix_config = copy.deepcopy(ecudata.matrix_config)
+	for k in local_matrix_config.keys():
 		local_matrix_config[k]['row_cycleTimer'] = 0
 		local_matrix_config[k]['value_refreshTimer'] = 0
 		local_matrix_config[k]['peak'] = False
@@ -267,7 +273,8 @@ def MatrixIO(ecudata, datamanager):
 	i = 0
 	previousId = False
 	while True:
-		logger.debug("Waking [connected = %s]" % (connected))
+		if DEBUG_ON:
+			logger.debug("Waking [connected = %s]", connected)
 		if connected:
 			
 			i += 1
@@ -379,7 +386,8 @@ def MatrixIO(ecudata, datamanager):
 						if (t >= settings.MATRIX_CONFIG[row]['value_refreshTime']):
 							
 							sensorId = local_matrix_config[row]['sensorIds'][0]
-							logger.debug("Row %s is in FIXED mode for sensor %s" % (row, sensorId))
+							if DEBUG_ON:
+								logger.debug("Row %s is in FIXED mode for sensor %s", row, sensorId)
 							# Display sensor information
 							if settings.MATRIX_MODE_PEAK in local_matrix_config[row]['mode']:
 								peak = True
@@ -431,7 +439,8 @@ def MatrixIO(ecudata, datamanager):
 						if local_matrix_config[row]['setting'] == settings.MATRIX_SETTING_FOR_BELOW:
 							parent_row = row + 1
 							
-						logger.debug("Row %s is in additional info mode for row %s" % (row, parent_row))
+						if DEBUG_ON:
+							logger.debug("Row %s is in additional info mode for row %s", row, parent_row)
 					
 					# Is the row configured to show peak values?
 				
@@ -18,10 +18,11 @@
 
 # Standard libraries
 import multiprocessing
-import time
+import logging
 import timeit 
 import sys
 import os
+from collections import deque
 
 # Sensor back end libraries
 from iomodules.sensors.Cosworth import CosworthSensors
@@ -30,13 +31,32 @@ from iomodules.sensors.Demo import DemoSensors
 # Settings file
 from libs import settings
 from libs.ControlData import ControlData
+from libs.SensorScheduler import SensorScheduler
 
 # Start a new logger
 from libs.newlog import newlog
 logger = newlog(__name__)
 
-def SensorIO(transmitQueue, receiveQueue, controlQueue):
-	""" Serial IO """
+# Every sensor sample is logged at debug level - skip formatting those
+# messages unless they will actually be shown
+DEBUG_ON = logger.isEnabledFor(logging.DEBUG)
+
+def buildSchedule(driver):
+	""" Return a SensorScheduler for each configured sensor the driver supports, in settings order """
+	
+	sensorIds = []
+	refresh = []
+	if driver:
+		driver_sensors = driver.available()
+		for sensor in settings.SENSORS:
+			sensorId = sensor['sensorId']
+			if sensorId in driver_sensors:
+				sensorIds.append(sensorId)
+				refresh.append(driver.data(sensorId)['refresh'])
+	return SensorScheduler(sensorIds = sensorIds, refresh = refresh)
+
+def SensorIO(ecudata, controlQueue):
+	""" Serial IO - publishes every sensor sample straight to the shared ecudata ring """
 		
 	proc_name = multiprocessing.current_process().name
 	myButtonId = settings.BUTTON_DEST_SENSORIO
@@ -72,6 +92,10 @@ def SensorIO(transmitQueue, receiveQueue, controlQueue):
 	####################################################
 	logger.info("Sensor retrieval starting")
 	
+	# Sensors whose definition has already been passed to ecudata - this
+	# only needs to happen once, not on every sample
+	mapped_sensors = []
+	
 	for sensor in settings.SENSORS:
 		sensorId = sensor['sensorId']
 		sensorData = False			
@@ -83,10 +107,23 @@ def SensorIO(transmitQueue, receiveQueue, controlQueue):
 				sensorData = demo.sensor(sensorId, force = True)
 				timerData = demo.performance(sensorId)
 		if sensorData:
-			receiveQueue.put((settings.TYPE_DATA, sensorData, 0, 0))
+			ecudata.setSensorData(sensorData['sensor'])
+			ecudata.setData(sensorId, sensorData['value'], 0, 0)
+			mapped_sensors.append(sensorId)
+	
+	# Sensors are read from demo mode or the ECU, never both
+	if SENSOR_DEMO:
+		driver = demo
+	else:
+		driver = cosworth
+	schedule = buildSchedule(driver)
+	
+	# The ECU is read with non-blocking serial exchanges. Sensors that
+	# fall due while the serial line is busy wait their turn here.
+	asynchronous = (driver is cosworth) and (cosworth is not None)
+	pending = deque()
 			
 	while True:
-		data_added = False
 		####################################################
 		#
 		# Listen for control messages
@@ -95,8 +132,9 @@ def SensorIO(transmitQueue, receiveQueue, controlQueue):
 		if controlQueue.empty() == False:
 			cdata = controlQueue.get()
 			if cdata.isMine(myButtonId):
-				logger.debug("Got a control message")
-				cdata.show()
+				if DEBUG_ON:
+					logger.debug("Got a control message")
+					cdata.show()
 				# We only do one thing:
 				# short press - turn on/off demo mode
 				
@@ -107,21 +145,29 @@ def SensorIO(transmitQueue, receiveQueue, controlQueue):
 						SENSOR_DEMO = False
 						demo = False
 						demo_sensors = []
+						driver = cosworth
+						schedule = buildSchedule(driver)
+						asynchronous = (cosworth is not None)
+						pending.clear()
 						status = {
 							'sourceId' : myButtonId,
 							'demoMode' : True
 						}
-						receiveQueue.put((settings.TYPE_STATUS, status, counter, None))
+						ecudata.setStatusData(status)
 					elif SENSOR_DEMO is False:
 						logger.info("Enable demo mode")
 						SENSOR_DEMO = True
 						demo = DemoSensors()
 						demo_sensors = demo.available()
+						driver = demo
+						schedule = buildSchedule(driver)
+						asynchronous = False
+						pending.clear()
 						status = {
 							'sourceId' : myButtonId,
 							'demoMode' : True
 						}
-						receiveQueue.put((settings.TYPE_STATUS, status, counter, None))
+						ecudata.setStatusData(status)
 
 						
 				# Reset Cosworth ecu comms
@@ -129,47 +175,67 @@ def SensorIO(transmitQueue, receiveQueue, controlQueue):
 					logger.info("Resetting Cosworth ECU serial connection")
 					cosworth.__reconnectECU__()
 					cosworth_sensors = cosworth.available()
+					if SENSOR_DEMO is False:
+						schedule = buildSchedule(driver)
+						pending.clear()
 		
 		####################################################
 		#
-		# Standard loop - do a read of sensors defined in
-		# the settings file.
+		# Standard loop - read only those sensors defined in
+		# the settings file whose refresh time has come round.
+		# The schedule picks them all out in one vectorised
+		# check, so sensors which are not yet due are never
+		# looked at individually.
 		#
 		####################################################
-		for sensor in settings.SENSORS:
+		now = timeit.default_timer()
+		samples = []
+		sample_counter_idx = schedule.sample_counter_idx
+		for idx in schedule.due(now):
 			
-			sensorId = sensor['sensorId']
-			sensorData = False
+			sensorId = schedule.sensor_ids[idx]
 			
-			# is demo mode disabled?
-			if SENSOR_DEMO is False:
-				# Is this a cosworth sensor?
-				if sensorId in cosworth_sensors:
-					sensorData = cosworth.sensor(sensorId)
-					timerData = cosworth.performance(sensorId)
-				# is it a gearbox sensor?
-				#elif sensorId in gearbox_sensors:
-				#	pass
-				# is it a wibble sensor?
-				#elif sensorId in wibble_sensors:
-				#	pass
+			# Each read of the highest sample rate sensor starts a new sample
+			if idx == sample_counter_idx:
+				counter += 1
+			
+			if asynchronous:
+				if sensorId not in pending:
+					pending.append(sensorId)
 			else:
-				# Otherwise read from the demo sensors, if demo mode is active
-				if (sensorData is False) and (sensorId in demo_sensors):
-					sensorData = demo.sensor(sensorId)
-					timerData = demo.performance(sensorId)
+				samples.append((sensorId, driver.sensor(sensorId, force = True, now = now)))
+		
+		# Collect any finished serial exchange, and start the next
+		# one straight away so the line is never left idle
+		if asynchronous:
+			samples.extend(driver.poll())
+			if pending and (driver.busy() is False):
+				driver.submit(pending.popleft())
+		
+		for sensorId, sensorData in samples:
+			
+			timerData = driver.performance(sensorId)
 			
 			# Did we get any data for this sensor?
 			if sensorData:
 				if sensorData['value'] is not None:
-					logger.debug("Received %s: value:%s counter:%s" % (sensorData['sensor']['sensorId'], sensorData['value'], counter))
-					receiveQueue.put((settings.TYPE_DATA, sensorData, counter, timerData['last']))
-					data_added = True
+					if DEBUG_ON:
+						logger.debug("Received %s: value:%s counter:%s", sensorId, sensorData['value'], counter)
+					if sensorId not in mapped_sensors:
+						ecudata.setSensorData(sensorData['sensor'])
+						mapped_sensors.append(sensorId)
+					ecudata.setData(sensorId, sensorData['value'], timerData['last'], counter)
 				
-		# Sleep at the end of each round so that we don't
-		# consume too many processor cycles. May need to experiment
-		# with this value for different platforms.
-		time.sleep(settings.SENSOR_SLEEP_TIME)
-		
-		if data_added:
-			counter += 1
\ No newline at end of file
+		# Sleep at the end of each round until the next sensor is
+		# due, so that we neither spin nor hold up the fastest
+		# sensors. A control message arriving cuts the sleep short.
+		# While a serial exchange is outstanding only sleep for
+		# about as long as a reply takes.
+		if asynchronous and driver.busy():
+			controlQueue.wait(settings.SENSOR_POLL_TIME)
+		else:
+			next_fire = schedule.next()
+			if next_fire is None:
+				controlQueue.wait(settings.CONTROL_POLL_MAX)
+			else:
+				controlQueue.wait(min(max(next_fire - timeit.default_timer(), 0), settings.CONTROL_POLL_MAX))
\ No newline at end of file
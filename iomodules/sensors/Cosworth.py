@@ -62,13 +62,13 @@ class CosworthSensors():
 			logger.warn("Unsupported sensor type: %s" % sensorId)
 			return None
 	
-	def sensor(self, sensorId, force = False):
-		""" Retrieve the latest value for a sensor """
+	def sensor(self, sensorId, force = False, now = None):
+		""" Retrieve the latest value for a sensor - 'now' is the caller's current timer value, if it has one """
 		
 		# Is it a valid sensor 
 		if sensorId in self.sensors.keys():
 			# Has the refresh timer expired
-			raw_v = self.sensors[sensorId].get(force = force)
+			raw_v = self.sensors[sensorId].get(force = force, now = now)
 			if raw_v:
 				v = self.__translate__(sensorId, raw_v)
 			else:
@@ -107,6 +107,88 @@ class CosworthSensors():
 			logger.warn("Unsupported sensor type: %s" % sensorId)
 			return None
 		
+	def submit(self, sensorId):
+		""" Start the serial exchange for a sensor, without waiting for the reply.
+		
+		Only one exchange can be outstanding on the serial line at a time - the
+		replies are not tagged - so this returns False if one already is, or if
+		the request could not be sent. Use poll() to collect the result.
+		"""
+		
+		if (self.connected is False) or (self.exchange is not None) or (sensorId not in self.sensors.keys()):
+			return False
+		
+		codes = self.sensors[sensorId].data()['controlCodes']
+		if len(codes) not in [1, 2]:
+			logger.error("Unsupported number of control codes for sensor %s" % sensorId)
+			return False
+		
+		try:
+			self.serial.write(self.requests[sensorId][0])
+		except Exception as e:
+			return False
+		
+		start = timeit.default_timer()
+		self.sensors[sensorId].resetTimer(start)
+		self.exchange = { 'sensorId' : sensorId, 'codes' : codes, 'stage' : 0, 'buffer' : self.buffers[sensorId], 'start' : start }
+		return True
+	
+	def busy(self):
+		""" Is there a serial exchange outstanding? """
+		
+		return self.exchange is not None
+	
+	def poll(self):
+		""" Collect whatever reply bytes have arrived so far, without blocking.
+		
+		Returns a list of (sensorId, sensor data) for each exchange completed, in
+		the same form as sensor() returns. Two byte sensors have their second
+		control code sent as soon as the first reply byte arrives.
+		"""
+		
+		completed = []
+		exchange = self.exchange
+		if exchange is None:
+			return completed
+		
+		try:
+			while self.serial.in_waiting > 0:
+				# Each reply byte goes straight into the sensor's own buffer
+				stage = exchange['stage']
+				reply = exchange['buffer'][stage:stage + 1]
+				if self.fd is not None:
+					if os.readv(self.fd, [reply]) == 0:
+						break
+				else:
+					data = self.serial.read(1)
+					if len(data) == 0:
+						break
+					reply[:] = data
+				exchange['stage'] += 1
+				if exchange['stage'] < len(exchange['codes']):
+					self.serial.write(self.requests[exchange['sensorId']][exchange['stage']])
+				else:
+					sensorId = exchange['sensorId']
+					self.exchange = None
+					raw_v = self.sensors[sensorId].put(int.from_bytes(exchange['buffer'], 'big'), (timeit.default_timer() - exchange['start']))
+					if raw_v:
+						v = self.__translate__(sensorId, raw_v)
+					else:
+						v = raw_v
+					completed.append((sensorId, {  'sensor' : self.sensors[sensorId].data(), 'value' : v, 'rawValue' : raw_v}))
+					return completed
+			
+			# Give up on a reply that never came, and throw away anything
+			# that turns up late so it can't be taken as the next reply
+			if (timeit.default_timer() - exchange['start']) > (self.comms_timeout * len(exchange['codes'])):
+				logger.debug("Timed out waiting for sensor %s" % exchange['sensorId'])
+				self.exchange = None
+				self.serial.reset_input_buffer()
+		except Exception as e:
+			self.exchange = None
+		
+		return completed
+		
 	def close(self):
 		""" Disconnect the sensor and clean up any resources """
 		logger.info("Closing sensor module")
@@ -150,6 +232,16 @@ class CosworthSensors():
 		self.comms_timeout = 0.1
 		self.serial = False
 		
+		# Any serial exchange started by submit() and not yet collected by poll()
+		self.exchange = None
+		
+		# Request bytes and reply buffers for each sensor, allocated once up
+		# front rather than on every exchange, and the raw serial file
+		# descriptor replies are read into them from
+		self.requests = {}
+		self.buffers = {}
+		self.fd = None
+		
 		# Sensor types
 		self.all_sensors = {
 			'RPM': { 
@@ -407,6 +499,10 @@ class CosworthSensors():
 				# Start timer
 				newSensor.resetTimer()
 				self.sensors[sensorId] = newSensor
+				# Pre-built request bytes and reply buffer for this sensor
+				codes = self.all_sensors[sensorId]['controlCodes']
+				self.requests[sensorId] = [bytes([code]) for code in codes]
+				self.buffers[sensorId] = memoryview(bytearray(len(codes)))
 			else:
 				logger.warn("Sensor type [%s] is unsupported for ecu [%s]" % (self.all_sensors[sensorId]['classId'], self.ecuType))
 				
@@ -432,6 +528,11 @@ class CosworthSensors():
 			)
 			logger.info("Serial interface up")
 			self.connected = True
+			# Read replies directly into our own buffers where the platform allows
+			if hasattr(os, 'readv'):
+				self.fd = self.serial.fileno()
+			else:
+				self.fd = None
 		except Exception as e:
 			self.connected = False
 			self.serial = False
@@ -444,6 +545,8 @@ class CosworthSensors():
 	
 	def __disconnectECU__(self):
 		""" Disconnect from ECU """
+		self.exchange = None
+		self.fd = None
 		try:
 			self.serial.close()
 			logger.info("Closed serial port for Cosworth ECU module")
@@ -24,6 +24,9 @@ import sys
 import os
 import copy
 
+# Numpy is used to generate the demo data sequences
+import numpy
+
 # Python serial library
 import serial
 
@@ -62,13 +65,13 @@ class DemoSensors():
 			logger.warn("Unsupported sensor type: %s" % sensorId)
 			return None
 	
-	def sensor(self, sensorId, force = False):
-		""" Retrieve the latest value for a sensor """
+	def sensor(self, sensorId, force = False, now = None):
+		""" Retrieve the latest value for a sensor - 'now' is the caller's current timer value, if it has one """
 		
 		# Is it a valid sensor 
 		if sensorId in self.sensors.keys():
 			# Has the refresh timer expired
-			v = self.sensors[sensorId].get(force = force)
+			v = self.sensors[sensorId].get(force = force, now = now)
 			return {  'sensor' : self.sensors[sensorId].data(), 'value' : v, 'rawValue' : v}
 		else:
 			# Not a valid sensor
@@ -136,7 +139,10 @@ class DemoSensors():
 		
 		# Available sensors
 		self.sensors = {}
-		self.demo_steps = steps
+		# The ramp up and back down is 2 * steps long. With steps rounded
+		# up to a power of two the index can wrap with a mask.
+		self.demo_steps = 1 << max(0, (steps - 1).bit_length())
+		self.demo_mask = (2 * self.demo_steps) - 1
 		self.__setSensors__()
 
 	def __get__(self, sensorData):
@@ -148,12 +154,8 @@ class DemoSensors():
 		value = None
 		get_start_time = timeit.default_timer()
 		idx = self.all_sensors[sensorId]['demo_idx']
-		value = self.all_sensors[sensorId]['demo_data'][idx]
-			
-		if self.all_sensors[sensorId]['demo_idx'] < (len (self.all_sensors[sensorId]['demo_data']) - 1):
-			self.all_sensors[sensorId]['demo_idx'] += 1
-		else:
-			self.all_sensors[sensorId]['demo_idx'] = 0
+		value = float(self.all_sensors[sensorId]['demo_data'][idx])
+		self.all_sensors[sensorId]['demo_idx'] = (idx + 1) & self.demo_mask
 		
 		return value, (timeit.default_timer() - get_start_time)
 	
@@ -166,16 +168,10 @@ class DemoSensors():
 		sensorIds = list(self.all_sensors.keys())
 		sensorIds.sort()
 		for sensorId in sensorIds:
-			# Generate the sequence of demo data
+			# Generate the sequence of demo data, a ramp up from min to max and back down again
 			logger.debug("Adding sensor [%s]" % self.all_sensors[sensorId]['classId'])
-			demo_step_size = (self.all_sensors[sensorId]['maxValue'] * 1.0) / self.demo_steps
-			d_value = self.all_sensors[sensorId]['minValue']
-			for d in range(0, self.demo_steps):
-				self.all_sensors[sensorId]['demo_data'].append(d_value)
-				d_value += demo_step_size
-			for d in range(0, self.demo_steps):
-				d_value = d_value - demo_step_size
-				self.all_sensors[sensorId]['demo_data'].append(d_value)
+			up = numpy.linspace(self.all_sensors[sensorId]['minValue'], self.all_sensors[sensorId]['maxValue'], self.demo_steps, dtype = numpy.float64)
+			self.all_sensors[sensorId]['demo_data'] = numpy.concatenate((up, up[::-1]))
 	
 			# Add a new instance of a generic sensor
 			newSensor = GenericSensor(sensorData = self.all_sensors[sensorId], getter = self.__get__)
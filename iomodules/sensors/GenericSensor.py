@@ -53,32 +53,48 @@ class GenericSensor():
 		
 		self.refreshTime = interval
 	
-	def resetTimer(self):
-		""" Set an initial timer """
+	def resetTimer(self, now = None):
+		""" Set the timer, to 'now' if the caller already has the current time """
 		
-		self.timer = timeit.default_timer()
+		if now is None:
+			now = timeit.default_timer()
+		self.timer = now
 	
-	def refresh(self):
+	def refresh(self, now = None):
 		""" Should the sensor be refreshed? """
 		
-		if (timeit.default_timer() - self.timer) >= self.refreshTime:
+		if now is None:
+			now = timeit.default_timer()
+		if (now - self.timer) >= self.refreshTime:
 			return True
 		else:
 			return False
 		
-	def get(self, force = False):
-		""" Get a new data value - if required - and return it """
+	def get(self, force = False, now = None):
+		""" Get a new data value - if required - and return it.
 		
-		if force or self.refresh():
+		Pass in 'now' when reading several sensors at once, so the current
+		time is looked up once per round rather than once per sensor.
+		"""
+		
+		if now is None:
+			now = timeit.default_timer()
+		if force or self.refresh(now):
+			self.timer = now
 			raw_value, get_time = self.getter(self.sensorData)
-			if (raw_value) and (get_time):
-				self.history_raw_values.append(raw_value)
-				self.history_get_times.append(get_time)
-				return self.value()
-			else:
-				return None
+			return self.put(raw_value, get_time)
 		else:
 			return self.value()
+	
+	def put(self, raw_value, get_time):
+		""" Store a value that was retrieved outside of get() - e.g. by a non-blocking exchange - and return it """
+		
+		if (raw_value) and (get_time):
+			self.history_raw_values.append(raw_value)
+			self.history_get_times.append(get_time)
+			return self.value()
+		else:
+			return None
 		
 	def value(self):
 		""" Return current value """
@@ -62,13 +62,13 @@ class ExampleSensors():
 			logger.warn("Unsupported sensor type: %s" % sensorId)
 			return None
 	
-	def sensor(self, sensorId, force = False):
-		""" Retrieve the latest value for a sensor """
+	def sensor(self, sensorId, force = False, now = None):
+		""" Retrieve the latest value for a sensor - 'now' is the caller's current timer value, if it has one """
 		
 		# Is it a valid sensor 
 		if sensorId in self.sensors.keys():
 			# Has the refresh timer expired
-			v = self.sensors[sensorId].get(force = force)
+			v = self.sensors[sensorId].get(force = force, now = now)
 			return {  'sensor' : self.sensors[sensorId].data(), 'value' : v }
 		else:
 			# Not a valid sensor
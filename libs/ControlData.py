@@ -20,6 +20,8 @@
 
 # Standard libraries
 import multiprocessing
+import pickle
+import struct
 import time
 import sys
 import os
@@ -33,6 +35,15 @@ if getattr(sys, 'frozen', False):
 	__file__ = os.path.dirname(sys.executable)
 logger = newlog(__file__)
 
+# Room in each packed control message for a (pickled) payload
+CONTROL_PAYLOAD_SIZE = 228
+
+# A control message packed as a fixed size record, so it can be passed
+# through a shared memory ring without pickling the whole object:
+# button (4 bytes), duration, destination, source, padding, payload length,
+# padding, created timestamp, payload
+CONTROL = struct.Struct('<4sBBBxH2xd%ds' % CONTROL_PAYLOAD_SIZE)
+
 class ControlData():
 	""" Control data class """
 	
@@ -42,6 +53,7 @@ class ControlData():
 		self.button = None
 		self.duration = None
 		self.destination = None
+		self.source = None
 		self.setButton()
 		self.setDuration()
 		self.setDestination()
@@ -80,6 +92,42 @@ class ControlData():
 			else:
 				self.destination = settings.BUTTON_DEST_ALL
 	
+	def setSource(self, source = None):
+		""" Set the worker that sent this message, so it is not sent back to it """
+		if source:
+			self.source = source
+	
+	def encode(self):
+		""" Return the fields of this message in CONTROL record order """
+		
+		if self.button:
+			button = self.button.encode('utf-8')
+		else:
+			button = b''
+		if self.data is not None:
+			payload = pickle.dumps(self.data, pickle.HIGHEST_PROTOCOL)
+			if len(payload) > CONTROL_PAYLOAD_SIZE:
+				logger.warning("Control data payload of %s bytes is too large - dropped" % len(payload))
+				payload = b''
+		else:
+			payload = b''
+		return (button, self.duration or 0, self.destination or 0, self.source or 0, len(payload), self.created, payload)
+	
+	def decode(self, fields):
+		""" Set the contents of this message from the fields of a CONTROL record """
+		
+		button, duration, destination, source, length, created, payload = fields
+		self.button = button.rstrip(b'\0').decode('utf-8') or None
+		self.duration = duration
+		self.destination = destination
+		self.source = source or None
+		self.created = created
+		if length:
+			self.data = pickle.loads(payload[:length])
+		else:
+			self.data = None
+		return self
+	
 	def isMine(self, my_destination = None):
 		""" Is this message for us? """
 		if my_destination:
@@ -96,6 +144,7 @@ class ControlData():
 		logger.debug("self.button 		= [%s]" % self.button)
 		logger.debug("self.duration 	= [%s]" % self.duration)
 		logger.debug("self.destination	= [%s]" % self.destination)
+		logger.debug("self.source		= [%s]" % self.source)
 		logger.debug("self.created		= [%s]" % self.created)
 		logger.debug("self.data			: %s" % self.data)
 		logger.debug("")
@@ -17,6 +17,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Standard libraries
+import logging
+import math
 import sys
 import os
 
@@ -28,60 +30,102 @@ from libs.newlog import newlog
 if getattr(sys, 'frozen', False):
 	__file__ = os.path.dirname(sys.executable)
 logger = newlog(__file__)
+
+# getData() is called for every sensor on every display refresh, so only
+# build its debug messages if they will actually be shown
+DEBUG_ON = logger.isEnabledFor(logging.DEBUG)
+
 class EcuData():
 	""" Class representing the current state of sensor data for the ECU """
 	
 	def __init__(self, 
-		ecuDataDict = None,
+		ecuDataRing = None,
 		ecuSensorDict = None,
-		ecuCounter = None, 
-		ecuErrors = None, 
-		ecuSampleTime = None, 
+		ecuValues = None,
 		ecuMatrixLCDDict = None,
 		ecuStatusDict = None):
-		""" Initialise the class with the shared data manager dictionary """
+		""" Initialise the class with the shared data manager dictionary, sample ring (or queue) and shared counters """
 		
-		self.data = ecuDataDict
+		self.ring = ecuDataRing
 		self.sensor = ecuSensorDict
-		self.errors = ecuErrors
-		self.counter = ecuCounter
-		self.timer = ecuSampleTime
+		self.values = ecuValues
 		self.status = ecuStatusDict
 		
-		# Initialise sensor values structure
+		# Initialise sensor values structure - this is a per-process
+		# snapshot of the latest sample for each sensor, brought up to
+		# date from the ring whenever it is read, once subscribed.
+		self.consumerId = None
+		self.cursor = 0
+		self.unsubscribedWarned = False
+		self.latest = {}
 		for sensor in settings.SENSORS:
 			# value, sample time, counter
-			self.data[sensor['sensorId']] = (0,0,0)
+			self.latest[sensor['sensorId']] = (0,0,0)
 		
 		# Store error codes as they occur
 		self.errors_ = []
 		
 		# Multi line matrix lcd displays can be configured to display
-		# different things...
+		# different things... this is a plain, read only dict, copied
+		# into each worker process rather than shared
 		self.matrix_config = ecuMatrixLCDDict
 	
 	def setError(self, errortext = None):
 		
 		self.errors_.append(errortext)
 	
+	@property
+	def data(self):
+		""" The latest (value, sample time, counter) of every sensor, as a dictionary """
+		
+		self.refresh()
+		return self.latest
+	
+	def subscribe(self, consumerId = None):
+		""" Start following the sample ring as consumer 'consumerId' - call once in each worker process """
+		
+		self.consumerId = consumerId
+		self.cursor = self.ring.subscribe(consumerId)
+		self.refresh()
+	
+	def refresh(self):
+		""" Copy any new samples from the shared ring into our local snapshot """
+		
+		if self.consumerId is None:
+			if self.unsubscribedWarned is False:
+				logger.warning("Sensor data read before subscribe() was called - no new samples will be seen by this process")
+				self.unsubscribedWarned = True
+			return None
+		samples, self.cursor = self.ring.drain(self.consumerId, self.cursor)
+		for (idx, value, counter, sampletime) in samples:
+			if math.isnan(value):
+				value = None
+			self.latest[settings.SENSOR_IDS[idx]] = (value, sampletime, counter)
+	
 	def setData(self, sensorId = None, value = 0, sampletime = 0, counter = 0):
 		""" Set the latest value for a sensor """
 		
-		self.counter.value = counter
-		if sensorId in self.data.keys():
-			self.data[sensorId] = (value, sampletime, counter)
+		self.values.counter[0] = counter
+		self.values.sampletime[0] = sampletime
+		# Samples are carried in the ring by their position in settings.SENSORS
+		if sensorId in settings.SENSOR_IDX:
+			if value is None:
+				value = float('nan')
+			self.ring.push(settings.SENSOR_IDX[sensorId], value, counter, sampletime)
 			
 	
 	def getData(self, sensorId = None, allData = False):
 		
-		if sensorId in self.data.keys():
-			if len(self.data[sensorId]) > 0:
-				logger.debug("Queried %s: value:%s sampletime:%.4f counter:%s [allData:%s]" % (sensorId, self.data[sensorId][0], self.data[sensorId][1], self.data[sensorId][2], allData))
-				if self.data[sensorId][0] is not None:
+		data = self.data
+		if sensorId in data.keys():
+			if len(data[sensorId]) > 0:
+				if DEBUG_ON:
+					logger.debug("Queried %s: value:%s sampletime:%.4f counter:%s [allData:%s]", sensorId, data[sensorId][0], data[sensorId][1], data[sensorId][2], allData)
+				if data[sensorId][0] is not None:
 					if allData:
-						return self.data[sensorId]
+						return data[sensorId]
 					else:
-						v = self.data[sensorId][0]
+						v = data[sensorId][0]
 						return v
 				
 		# If no data has been recorded, or the value of the data is None, then simply return None as the result, ignoring any sample timer or loop counter
@@ -124,12 +168,17 @@ class EcuData():
 	def setCounter(self, counter):
 		""" Set counter """
 		
-		self.counter.value = int(counter)
+		self.values.counter[0] = int(counter)
 	
 	def getCounter(self):
 		""" Return current sample counter """
 		
-		return int(self.counter.value)
+		return int(self.values.counter[0])
+	
+	def getSampleTime(self):
+		""" Return the sample time of the latest sensor reading """
+		
+		return float(self.values.sampletime[0])
 	
 	def get_errors(self):
 		""" Return a list of any logged errors """
@@ -140,5 +189,6 @@ class EcuData():
 	def set_errors_reset(self):
 		""" Reset any stored errors in the current data """
 		logger.debug("Resetting any stored error codes")
-		self.errors = []
+		self.errors_ = []
+		self.values.errors[:] = 0
 		return True
\ No newline at end of file
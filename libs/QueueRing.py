@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+# QueueRing - multiprocessing.Queue based stand-ins for the shared memory
+# rings, for platforms where those can't be used.
+# Copyright (C) 2018  John Snowdon
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Use as follows:
+#
+# Set USE_SHARED_RINGS = False in the settings file, and BroadcastQueue,
+# ControlBroadcastQueue and ControlQueue are used in place of BroadcastRing,
+# ControlBroadcastRing and ControlRing. They have the same methods, so nothing
+# else needs to know which is in use.
+#
+# Every message is packed with the same struct as the rings use before it
+# is put on a queue, so each one is a single fixed size bytes object
+# rather than a pickled tuple or class instance.
+
+# Standard libraries
+import multiprocessing
+from multiprocessing.reduction import ForkingPickler
+import queue
+import struct
+import sys
+import os
+
+# Settings file
+from libs import settings
+
+# Control data messages
+from libs.ControlData import ControlData, CONTROL
+
+# Sample layout shared with the rings
+from libs.SharedRing import SAMPLE
+
+# Start a new logger
+from libs.newlog import newlog
+if getattr(sys, 'frozen', False):
+	__file__ = os.path.dirname(sys.executable)
+logger = newlog(__file__)
+
+class BroadcastQueue():
+	""" A single producer, multiple consumer broadcast of sensor samples.
+
+	Each consumer has its own bounded queue, and every sample is put on all
+	of them. Queues only exist for the consumer ids passed to register(),
+	which must be called in the main process before the producer and
+	consumers are started. Where a consumer falls behind, its oldest samples
+	are thrown away to make room, just as the ring overwrites them.
+	"""
+
+	def __init__(self, capacity = 1024, maxConsumers = 8, slotStruct = SAMPLE):
+		""" Create an empty broadcast - consumers are added with register() """
+
+		self.capacity = capacity
+		self.maxConsumers = maxConsumers
+		self.slot = slotStruct
+		self.queues = {}
+
+	def __getstate__(self):
+		""" The queues and the sample layout are passed to a new process """
+
+		return { 'capacity' : self.capacity, 'maxConsumers' : self.maxConsumers, 'slot' : self.slot.format, 'queues' : self.queues }
+
+	def __setstate__(self, state):
+		""" Pick up the queues in a new process """
+
+		self.capacity = state['capacity']
+		self.maxConsumers = state['maxConsumers']
+		self.slot = struct.Struct(state['slot'])
+		self.queues = state['queues']
+
+	def push(self, *fields):
+		""" Pack a sample and put it on every consumer queue - producer only """
+
+		record = self.slot.pack(*fields)
+		for q in self.queues.values():
+			try:
+				q.put_nowait(record)
+			except queue.Full:
+				# Make room by dropping the oldest sample. It may still be
+				# on its way to the pipe through the feeder thread, so give
+				# it a moment to arrive.
+				try:
+					q.get(timeout = 0.05)
+				except queue.Empty:
+					pass
+				try:
+					q.put_nowait(record)
+				except queue.Full:
+					pass
+
+	def register(self, consumerId = 1):
+		""" Create the queue for consumer 'consumerId' - main process only, before any worker starts """
+
+		if (consumerId < 1) or (consumerId > self.maxConsumers):
+			raise ValueError("Consumer id must be between 1 and %s [consumerId=%s]" % (self.maxConsumers, consumerId))
+		if consumerId not in self.queues.keys():
+			self.queues[consumerId] = multiprocessing.Queue(maxsize = self.capacity)
+
+	def subscribe(self, consumerId = 1):
+		""" Start reading as consumer 'consumerId', and return its starting cursor """
+
+		if consumerId not in self.queues.keys():
+			raise ValueError("Consumer id was not registered before the workers started [consumerId=%s]" % consumerId)
+		return 0
+
+	def drain(self, consumerId = 1, cursor = 0, maxItems = None):
+		""" Return a list of every waiting sample, and the updated cursor - consumer only """
+
+		items = []
+		q = self.queues[consumerId]
+		while (maxItems is None) or (len(items) < maxItems):
+			try:
+				items.append(self.slot.unpack(q.get_nowait()))
+			except queue.Empty:
+				break
+		return items, cursor + len(items)
+
+	def close(self):
+		""" Close all of the consumer queues """
+
+		for q in self.queues.values():
+			q.close()
+
+class ControlBroadcastQueue():
+	""" Fan control messages out to a ControlQueue per worker.
+
+	put() packs and pickles each message just once, then writes the same
+	bytes straight to the pipe of every worker's queue it is addressed to,
+	skipping the one that sent it. That uses multiprocessing.Queue internals - the _writer
+	connection, the _wlock that its feeder thread also writes under, and
+	the _sem counting free places - so it needs checking against any new
+	Python release. A worker that has fallen behind, or never reads its
+	queue at all, loses its oldest message to make room, just as the
+	shared ring overwrites messages it hasn't read.
+	"""
+
+	def __init__(self, capacity = 64, maxConsumers = 8):
+		""" Queues are created as each worker's reader is asked for """
+
+		self.capacity = capacity
+		self.maxConsumers = maxConsumers
+		self.readers = {}
+
+	def put(self, cdata):
+		""" Send a control message to the worker(s) it is for, apart from the one that sent it """
+
+		record = ForkingPickler.dumps(CONTROL.pack(*cdata.encode()))
+		for consumerId, reader in self.readers.items():
+			if consumerId == cdata.source:
+				continue
+			if (cdata.destination != consumerId) and (cdata.destination != settings.BUTTON_DEST_ALL):
+				continue
+			q = reader.queue
+			if q._sem.acquire(False) is False:
+				# Full - throw away the oldest message, which releases a place.
+				# If the worker has just taken it itself, its place is
+				# given back straight after.
+				try:
+					q.get_nowait()
+				except queue.Empty:
+					pass
+				if q._sem.acquire(True, 0.1) is False:
+					continue
+			if q._wlock is None:
+				q._writer.send_bytes(record)
+			else:
+				with q._wlock:
+					q._writer.send_bytes(record)
+		return True
+
+	def reader(self, consumerId):
+		""" Return the ControlQueue for worker 'consumerId' """
+
+		if consumerId not in self.readers.keys():
+			self.readers[consumerId] = ControlQueue(capacity = self.capacity)
+		return self.readers[consumerId]
+
+	def close(self):
+		""" Close every worker's queue """
+
+		for reader in self.readers.values():
+			reader.close()
+
+class ControlQueue():
+	""" A queue of control messages, each one packed with the CONTROL struct """
+
+	def __init__(self, capacity = 64):
+		""" Create a new control queue - it is always safe for multiple producers """
+
+		self.queue = multiprocessing.Queue(maxsize = capacity)
+		# A message taken off the queue by wait(), and not yet returned by get()
+		self.pending = None
+
+	def __getstate__(self):
+		""" Only the queue itself is passed to a new process """
+
+		return { 'queue' : self.queue }
+
+	def __setstate__(self, state):
+		""" Pick up the queue in a new process """
+
+		self.queue = state['queue']
+		self.pending = None
+
+	def put(self, cdata):
+		""" Add a control message, returning False if the queue is full """
+
+		try:
+			self.queue.put_nowait(CONTROL.pack(*cdata.encode()))
+			return True
+		except queue.Full:
+			logger.warning("Control queue is full - message dropped")
+			return False
+
+	def empty(self):
+		""" Is there nothing to read? - consumer only """
+
+		return (self.pending is None) and self.queue.empty()
+
+	def wait(self, timeout = 1.0):
+		""" Sleep until there is a message to read, or at most 'timeout' seconds - consumer only.
+
+		Returns True if there is a message waiting.
+		"""
+
+		if self.pending is None:
+			try:
+				self.pending = self.queue.get(timeout = timeout)
+			except queue.Empty:
+				return False
+		return True
+
+	def get(self):
+		""" Remove and return the next control message, or None if there is none - consumer only """
+
+		record = self.pending
+		self.pending = None
+		if record is None:
+			try:
+				record = self.queue.get_nowait()
+			except queue.Empty:
+				return None
+		return ControlData().decode(CONTROL.unpack(record))
+
+	def close(self):
+		""" Close the queue """
+
+		self.queue.close()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+#
+# SensorScheduler - decide which sensors are due to be read on each
+# round of the SensorIO loop.
+# Copyright (C) 2018  John Snowdon
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Use as follows:
+#
+# schedule = SensorScheduler(sensorIds = ['RPM', 'ECT'], refresh = [0.1, 0.5])
+# for idx in schedule.due(timeit.default_timer()):
+#	read(schedule.sensor_ids[idx])
+#
+# The refresh interval and last read time of every sensor are held in
+# parallel numpy arrays, one slot per sensor, so finding all the sensors
+# that are due is one vectorised subtract and compare per round rather
+# than a Python loop over every sensor. If numba is installed, the scan is
+# compiled to native code instead.
+
+# Standard libraries
+import sys
+import os
+
+# Numpy holds the per-sensor timing arrays
+import numpy
+
+# Numba is optional - without it we use the vectorised numpy check
+try:
+	from numba import njit
+	USE_NUMBA = True
+except Exception as e:
+	USE_NUMBA = False
+
+# Start a new logger
+from libs.newlog import newlog
+if getattr(sys, 'frozen', False):
+	__file__ = os.path.dirname(sys.executable)
+logger = newlog(__file__)
+
+def scan_due(now, last_fire, refresh, out_idx):
+	""" Write the slot of every sensor due at 'now' into out_idx, mark them as read, and return how many there were """
+
+	n = 0
+	for i in range(last_fire.size):
+		if (now - last_fire[i]) >= refresh[i]:
+			out_idx[n] = i
+			n += 1
+			last_fire[i] = now
+	return n
+
+if USE_NUMBA:
+	scan_due = njit(cache = True)(scan_due)
+
+class SensorScheduler():
+	""" Timing data for a set of sensors, one array slot per sensor """
+
+	def __init__(self, sensorIds = (), refresh = ()):
+		""" Set up the arrays - every sensor is due on the first call to due() """
+
+		self.sensor_ids = list(sensorIds)
+		self.refresh = numpy.array(refresh, dtype = numpy.float64)
+		# Never read, so that rounding can't leave any sensor just short of due
+		self.last_fire = numpy.full(len(self.sensor_ids), -numpy.inf, dtype = numpy.float64)
+		# Scratch space for scan_due(), allocated once
+		self.out_buf = numpy.empty(len(self.sensor_ids), dtype = numpy.int32)
+		# The slot of the sensor with the highest sample rate, which drives
+		# the sample counter
+		if len(self.sensor_ids) > 0:
+			self.sample_counter_idx = int(numpy.argmin(self.refresh))
+		else:
+			self.sample_counter_idx = None
+
+	def due(self, now):
+		""" Return the slot of every sensor due to be read, and mark them as read at 'now'.
+
+		With numba, the result is a view onto a buffer that the next call
+		overwrites.
+		"""
+
+		if USE_NUMBA:
+			n = scan_due(now, self.last_fire, self.refresh, self.out_buf)
+			return self.out_buf[:n]
+
+		idxs = numpy.flatnonzero((now - self.last_fire) >= self.refresh)
+		self.last_fire[idxs] = now
+		return idxs
+
+	def next(self):
+		""" Return the time at which the next sensor is due, or None if there are no sensors """
+
+		if len(self.sensor_ids) == 0:
+			return None
+		return float(numpy.min(self.last_fire + self.refresh))
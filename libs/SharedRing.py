@@ -0,0 +1,600 @@
+#!/usr/bin/env python
+
+# SharedRing - fixed size ring buffers held in shared memory, used to pass
+# sensor samples between PyCosworth worker processes.
+# Copyright (C) 2018  John Snowdon
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Standard libraries
+import multiprocessing
+import tempfile
+import secrets
+import atexit
+import struct
+import mmap
+import sys
+import os
+from collections import deque
+
+# Numpy views onto shared values
+import numpy
+
+# Settings file
+from libs import settings
+
+# Sleep/wake on shared memory words
+from libs import futex
+
+# Control data messages
+from libs.ControlData import ControlData, CONTROL
+
+# Start a new logger
+from libs.newlog import newlog
+if getattr(sys, 'frozen', False):
+	__file__ = os.path.dirname(sys.executable)
+logger = newlog(__file__)
+
+# Every index word in a ring header lives on its own cache line, so that
+# the producer writing the tail never invalidates the line a reader is
+# polling for the head (and vice versa).
+CACHELINE = 64
+
+# A single unsigned 64bit index word
+INDEX = struct.Struct('<Q')
+
+# A single unsigned 32bit word, as used by futex()
+WORD = struct.Struct('<I')
+
+# Shared regions are files on a tmpfs mount, never on the SD card
+if os.path.isdir('/dev/shm'):
+	SHM_DIR = '/dev/shm'
+else:
+	SHM_DIR = tempfile.gettempdir()
+
+# A single sensor sample:
+# sensor index (u8), padding, value (f64), counter (u64), sample time (f64)
+SAMPLE = struct.Struct('<B7xdQd')
+
+class SharedRegion():
+	""" A named, memory mapped file under SHM_DIR, shared between processes.
+
+	The file is sized with ftruncate(), so it starts out sparse and reads as
+	zeros without a single page being written. The process that creates it
+	removes it on close(), or at exit if it never got that far. A region
+	left behind by a crash can still be inspected under SHM_DIR.
+	"""
+
+	def __init__(self, name = None, create = False, size = 0):
+		""" Create a new region of 'size' bytes, or attach to the existing region 'name' """
+
+		if create:
+			while True:
+				name = 'pycosworth-%s' % secrets.token_hex(8)
+				self.path = os.path.join(SHM_DIR, name)
+				try:
+					fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+					break
+				except FileExistsError:
+					continue
+			atexit.register(self.unlink)
+			try:
+				os.ftruncate(fd, size)
+				self.mm = mmap.mmap(fd, size)
+			finally:
+				os.close(fd)
+		else:
+			self.path = os.path.join(SHM_DIR, name)
+			fd = os.open(self.path, os.O_RDWR)
+			try:
+				size = os.fstat(fd).st_size
+				self.mm = mmap.mmap(fd, size)
+			finally:
+				os.close(fd)
+		self.name = name
+		self.size = size
+		self.buf = memoryview(self.mm)
+
+	def close(self):
+		""" Unmap the region from this process """
+
+		self.buf.release()
+		self.mm.close()
+
+	def unlink(self):
+		""" Remove the backing file """
+
+		try:
+			os.unlink(self.path)
+		except FileNotFoundError:
+			pass
+
+class SharedRing():
+	""" A fixed number of fixed size slots in a shared memory region.
+
+	The region starts with a header of 'headerLines' cache lines, each one
+	holding a single 64bit index word, followed by 'capacity' slots of
+	'slotStruct.size' bytes. Capacity must be a power of two so that a
+	running sequence number can be turned into a slot with a mask, rather
+	than a modulo or a branch.
+
+	Index words are written with a single aligned 8 byte store and read
+	with a single aligned 8 byte load, which is atomic on the x86-64 and
+	ARMv8 platforms we run on, so no consumer ever takes a lock. The only
+	cross-process lock is the one ControlRing producers share to claim slots.
+
+	Atomic is not the same as ordered, though: Python has no memory barrier,
+	and ARMv8 is weakly ordered, so a consumer there can see an index word
+	change before the slot contents written ahead of it. Consumers must
+	treat whatever they read from a slot as possibly torn.
+	"""
+
+	def __init__(self, capacity = 1024, slotStruct = SAMPLE, headerLines = 2):
+		""" Create a new ring in shared memory """
+
+		if (capacity < 2) or (capacity & (capacity - 1)):
+			raise ValueError("Ring capacity must be a power of two [capacity=%s]" % capacity)
+
+		self.capacity = capacity
+		self.mask = capacity - 1
+		self.slot = slotStruct
+		self.headerSize = headerLines * CACHELINE
+		self.size = self.headerSize + (capacity * slotStruct.size)
+		self.shm = SharedRegion(create = True, size = self.size)
+		self.buf = self.shm.buf
+		self.owner = True
+
+		# A new region is all zeros, which is an empty ring, and slot
+		# contents are only valid once indexed
+		logger.debug("Created shared ring [%s] %s slots of %s bytes" % (self.shm.name, capacity, slotStruct.size))
+
+	def __getstate__(self):
+		""" Only the name of the shared memory region is passed to a new process """
+
+		return { 'name' : self.shm.name, 'capacity' : self.capacity, 'slot' : self.slot.format, 'headerSize' : self.headerSize }
+
+	def __setstate__(self, state):
+		""" Attach to an existing shared memory region in a new process """
+
+		self.capacity = state['capacity']
+		self.mask = self.capacity - 1
+		self.slot = struct.Struct(state['slot'])
+		self.headerSize = state['headerSize']
+		self.size = self.headerSize + (self.capacity * self.slot.size)
+		self.shm = SharedRegion(name = state['name'])
+		self.buf = self.shm.buf
+		self.owner = False
+
+	def _load(self, line):
+		""" Load the index word held in header cache line 'line' """
+
+		return INDEX.unpack_from(self.buf, line * CACHELINE)[0]
+
+	def _store(self, line, value):
+		""" Store the index word held in header cache line 'line' """
+
+		INDEX.pack_into(self.buf, line * CACHELINE, value)
+
+	def _offset(self, seq):
+		""" Byte offset of the slot used by sequence number 'seq' """
+
+		return self.headerSize + ((seq & self.mask) * self.slot.size)
+
+	def close(self):
+		""" Detach from the shared memory region, removing it if we created it """
+
+		self.buf = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+class BroadcastRing(SharedRing):
+	""" A single producer, multiple consumer broadcast ring.
+
+	Header line 0 holds the producer tail, the next sequence number to be
+	written. Header lines 1..maxConsumers each hold the read position of
+	one consumer, so that progress of every reader can be seen from any
+	process. Every consumer reads every item independently of the others;
+	the producer never waits for a slow consumer, it simply laps it.
+
+	Each slot is prefixed by the sequence number it currently holds. The
+	producer marks a slot as busy before rewriting it, so a consumer that
+	has been lapped, or that reads a slot mid-update, can detect it by
+	comparing the sequence number before and after copying the payload.
+	Without a memory barrier that check is not watertight on weakly
+	ordered CPUs (see SharedRing), but a torn sample is only ever a stale
+	value, never an exception.
+	"""
+
+	TAIL = 0
+	BUSY = 0xFFFFFFFFFFFFFFFF
+
+	def __init__(self, capacity = 1024, maxConsumers = 8, slotStruct = SAMPLE, extraLines = 0):
+		""" Create a new broadcast ring, with 'extraLines' spare header lines after the consumer heads """
+
+		self.payload = slotStruct
+		SharedRing.__init__(self,
+			capacity = capacity,
+			slotStruct = struct.Struct('<Q' + slotStruct.format.lstrip('<')),
+			headerLines = maxConsumers + 1 + extraLines)
+		self.maxConsumers = maxConsumers
+		# Producer-local copy of the tail, it is the only writer
+		self.tail = 0
+
+	def __getstate__(self):
+		""" Also pass the consumer count and payload layout """
+
+		state = SharedRing.__getstate__(self)
+		state['maxConsumers'] = self.maxConsumers
+		state['payload'] = self.payload.format
+		return state
+
+	def __setstate__(self, state):
+		""" Attach to an existing broadcast ring """
+
+		SharedRing.__setstate__(self, state)
+		self.maxConsumers = state['maxConsumers']
+		self.payload = struct.Struct(state['payload'])
+		self.tail = self._load(self.TAIL)
+
+	def push(self, *fields):
+		""" Publish one item to every consumer - producer only """
+
+		tail = self.tail
+		offset = self._offset(tail)
+		INDEX.pack_into(self.buf, offset, self.BUSY)
+		self.slot.pack_into(self.buf, offset, tail, *fields)
+		self.tail = tail + 1
+		self._store(self.TAIL, self.tail)
+
+	def register(self, consumerId = 1):
+		""" Nothing to do - every consumer id has its head in the ring from the start """
+
+		pass
+
+	def subscribe(self, consumerId = 1):
+		""" Return a starting cursor for a new consumer.
+
+		Consumer ids run from 1 to maxConsumers. The cursor is the oldest item
+		still held in the ring, so that a new consumer immediately has the
+		most recent history.
+		"""
+
+		if (consumerId < 1) or (consumerId > self.maxConsumers):
+			raise ValueError("Consumer id out of range [consumerId=%s maxConsumers=%s]" % (consumerId, self.maxConsumers))
+		cursor = max(0, self._load(self.TAIL) - self.capacity)
+		self._store(consumerId, cursor)
+		return cursor
+
+	def drain(self, consumerId = 1, cursor = 0, maxItems = None):
+		""" Read every item published since 'cursor'.
+
+		Returns a list of payload tuples and the new cursor position. Items
+		overwritten before this consumer got to them are skipped.
+		"""
+
+		tail = self._load(self.TAIL)
+		if tail == cursor:
+			return [], cursor
+
+		# Lapped by more than a whole ring - skip to the oldest we can still read
+		if (tail - cursor) > self.capacity:
+			cursor = tail - self.capacity
+		if maxItems and (tail - cursor) > maxItems:
+			tail = cursor + maxItems
+
+		items = []
+		buf = self.buf
+		for seq in range(cursor, tail):
+			offset = self._offset(seq)
+			item = self.slot.unpack_from(buf, offset)
+			# The slot still holds our sequence number once we have copied it,
+			# so it was not rewritten underneath us
+			if (item[0] == seq) and (INDEX.unpack_from(buf, offset)[0] == seq):
+				items.append(item[1:])
+
+		self._store(consumerId, tail)
+		return items, tail
+
+class ControlBroadcastRing(BroadcastRing):
+	""" A broadcast ring of ControlData messages, read by every worker.
+
+	The main process put()s each message once, however many workers there
+	are, and each worker reads it through its own ControlReader, using its
+	BUTTON_DEST_* id as its consumer id. A worker only sees the messages
+	addressed to it or to BUTTON_DEST_ALL, and never the ones it sent itself.
+
+	The header line after the consumer heads holds a 32bit doorbell, bumped
+	after every message, that readers sleep on in wait(). Control messages
+	are rare, so every put() wakes all sleeping readers rather than keeping
+	track of which ones are asleep.
+	"""
+
+	def __init__(self, capacity = 64, maxConsumers = 8):
+		""" Create a new control broadcast ring """
+
+		BroadcastRing.__init__(self,
+			capacity = capacity,
+			maxConsumers = maxConsumers,
+			slotStruct = CONTROL,
+			extraLines = 1)
+		self.bellOffset = (maxConsumers + 1) * CACHELINE
+		self.bell = futex.address(self.buf, self.bellOffset)
+
+	def __setstate__(self, state):
+		""" Attach to an existing control broadcast ring """
+
+		BroadcastRing.__setstate__(self, state)
+		self.bellOffset = (self.maxConsumers + 1) * CACHELINE
+		self.bell = futex.address(self.buf, self.bellOffset)
+
+	def put(self, cdata):
+		""" Publish a control message to every worker - producer only """
+
+		self.push(*cdata.encode())
+		WORD.pack_into(self.buf, self.bellOffset, (WORD.unpack_from(self.buf, self.bellOffset)[0] + 1) & 0xFFFFFFFF)
+		futex.wake(self.bell, self.maxConsumers)
+		return True
+
+	def reader(self, consumerId):
+		""" Return the ControlReader for worker 'consumerId' """
+
+		return ControlReader(self, consumerId)
+
+def decodeControl(fields):
+	""" Return a ControlData built from the fields of a CONTROL record, or None if the record was torn """
+
+	try:
+		return ControlData().decode(fields)
+	except Exception as e:
+		logger.warning("Dropped an unreadable control message: %s" % e)
+		return None
+
+class ControlReader():
+	""" One worker's view of a ControlBroadcastRing.
+
+	It has the same empty(), get() and wait() methods as a ControlRing, so
+	a worker can't tell which one it has been given.
+	"""
+
+	# Position of the destination and source fields in a CONTROL record
+	DESTINATION = 2
+	SOURCE = 3
+
+	def __init__(self, ring, consumerId):
+		""" Subscribe to the ring as 'consumerId' """
+
+		self.ring = ring
+		self.consumerId = consumerId
+		self.cursor = ring.subscribe(consumerId)
+		self.pending = deque()
+
+	def _fill(self):
+		""" Pick up any new messages for this worker, and not sent by it.
+
+		Messages are filtered on the unpacked record fields, so no ControlData
+		is ever built for a message meant for some other worker. Any that
+		can't be decoded are dropped here, so empty() can be trusted.
+		"""
+
+		if len(self.pending) == 0:
+			items, self.cursor = self.ring.drain(self.consumerId, self.cursor)
+			for fields in items:
+				if fields[self.SOURCE] == self.consumerId:
+					continue
+				if (fields[self.DESTINATION] == self.consumerId) or (fields[self.DESTINATION] == settings.BUTTON_DEST_ALL):
+					cdata = decodeControl(fields)
+					if cdata is not None:
+						self.pending.append(cdata)
+
+	def empty(self):
+		""" Is there nothing to read? """
+
+		self._fill()
+		return len(self.pending) == 0
+
+	def wait(self, timeout = 1.0):
+		""" Sleep until there is a message to read, or at most 'timeout' seconds.
+
+		Returns True if there is a message waiting.
+		"""
+
+		if not self.empty():
+			return True
+		bell = WORD.unpack_from(self.ring.buf, self.ring.bellOffset)[0]
+		# A message may have been published before we read the doorbell
+		if self.empty():
+			futex.wait(self.ring.bell, bell, timeout)
+		return not self.empty()
+
+	def get(self):
+		""" Remove and return the next control message, or None if there is none """
+
+		self._fill()
+		if len(self.pending) == 0:
+			return None
+		return self.pending.popleft()
+
+	def close(self):
+		""" Nothing to do - the ring itself is closed by the process that created it """
+
+		pass
+
+class ControlRing(SharedRing):
+	""" A ring of ControlData messages with a single consumer.
+
+	This is a drop-in for the multiprocessing.Queue that was used for control
+	messages - it has the same put(), get() and empty() methods - but each
+	message is a fixed size record packed straight into shared memory.
+
+	Header line 0 holds the tail, the next sequence number to be claimed by
+	a producer, and header line 1 the head, the next one the consumer will
+	read. Each slot is prefixed by a commit word which the producer sets to
+	sequence + 1 only once the message itself has been written, so the
+	consumer never needs to look at the tail at all.
+
+	Header line 2 holds a 32bit doorbell, bumped after every commit, and a
+	flag the consumer raises before sleeping on the doorbell with wait().
+	A producer only makes the wake system call when that flag is set.
+
+	Any number of processes may put() messages: a producer claims its slot
+	by advancing the tail under a lock, then fills and commits it outside
+	the lock. Python has no cross-process fetch-and-add, so this lock stands
+	in for it; the consumer never takes it.
+	"""
+
+	TAIL = 0
+	HEAD = 1
+	BELL = 2 * CACHELINE
+	WAITING = BELL + WORD.size
+
+	def __init__(self, capacity = 64):
+		""" Create a new control ring """
+
+		SharedRing.__init__(self,
+			capacity = capacity,
+			slotStruct = struct.Struct('<Q' + CONTROL.format.lstrip('<')),
+			headerLines = 3)
+		self.bell = futex.address(self.buf, self.BELL)
+		self.lock = multiprocessing.Lock()
+		# Consumer copy of the head
+		self.head = 0
+
+	def __getstate__(self):
+		""" Also pass the producer lock """
+
+		state = SharedRing.__getstate__(self)
+		state['lock'] = self.lock
+		return state
+
+	def __setstate__(self, state):
+		""" Attach to an existing control ring """
+
+		SharedRing.__setstate__(self, state)
+		self.bell = futex.address(self.buf, self.BELL)
+		self.lock = state['lock']
+		self.head = self._load(self.HEAD)
+
+	def _reserve(self):
+		""" Claim the next free slot, returning its sequence number, or None if the ring is full """
+
+		with self.lock:
+			tail = self._load(self.TAIL)
+			if (tail - self._load(self.HEAD)) >= self.capacity:
+				return None
+			self._store(self.TAIL, tail + 1)
+			return tail
+
+	def put(self, cdata):
+		""" Add a control message to the ring """
+
+		seq = self._reserve()
+		if seq is None:
+			logger.warning("Control ring [%s] is full - message dropped" % self.shm.name)
+			return False
+		offset = self._offset(seq)
+		CONTROL.pack_into(self.buf, offset + INDEX.size, *cdata.encode())
+		INDEX.pack_into(self.buf, offset, seq + 1)
+
+		# Ring the doorbell, and only wake the consumer if it is asleep
+		WORD.pack_into(self.buf, self.BELL, (WORD.unpack_from(self.buf, self.BELL)[0] + 1) & 0xFFFFFFFF)
+		if WORD.unpack_from(self.buf, self.WAITING)[0]:
+			futex.wake(self.bell)
+		return True
+
+	def empty(self):
+		""" Is there nothing waiting to be read? - consumer only """
+
+		return INDEX.unpack_from(self.buf, self._offset(self.head))[0] != (self.head + 1)
+
+	def wait(self, timeout = 1.0):
+		""" Sleep until there is a message to read, or at most 'timeout' seconds - consumer only.
+
+		Returns True if there is a message waiting.
+		"""
+
+		if not self.empty():
+			return True
+		bell = WORD.unpack_from(self.buf, self.BELL)[0]
+		WORD.pack_into(self.buf, self.WAITING, 1)
+		# A message may have been committed before we raised the flag
+		if self.empty():
+			futex.wait(self.bell, bell, timeout)
+		WORD.pack_into(self.buf, self.WAITING, 0)
+		return not self.empty()
+
+	def get(self):
+		""" Remove and return the next control message, or None if there is none or it was torn - consumer only """
+
+		if self.empty():
+			return None
+		fields = CONTROL.unpack_from(self.buf, self._offset(self.head) + INDEX.size)
+		self.head += 1
+		self._store(self.HEAD, self.head)
+		return decodeControl(fields)
+
+class SharedValues():
+	""" The sample counter, latest sample time and error codes, held in shared memory.
+
+	Header line 0 holds the counter (u64) and sample time (f64), and the
+	error codes (i32) start on the next cache line. Each is exposed as a
+	numpy view onto the region rather than a multiprocessing.Value or
+	Array, so reads and writes are plain aligned loads and stores with no
+	lock around them.
+	"""
+
+	COUNTER = 0
+	SAMPLETIME = 8
+	ERRORS = CACHELINE
+
+	def __init__(self, maxErrors = 255):
+		""" Create the shared region, with everything set to zero """
+
+		self.maxErrors = maxErrors
+		self.size = self.ERRORS + (((maxErrors * 4) + CACHELINE - 1) // CACHELINE) * CACHELINE
+		self.shm = SharedRegion(create = True, size = self.size)
+		self.owner = True
+		self._views()
+
+	def __getstate__(self):
+		""" Only the name of the shared memory region is passed to a new process """
+
+		return { 'name' : self.shm.name, 'maxErrors' : self.maxErrors, 'size' : self.size }
+
+	def __setstate__(self, state):
+		""" Attach to an existing shared memory region in a new process """
+
+		self.maxErrors = state['maxErrors']
+		self.size = state['size']
+		self.shm = SharedRegion(name = state['name'])
+		self.owner = False
+		self._views()
+
+	def _views(self):
+		""" Map the numpy views onto the region """
+
+		self.counter = numpy.ndarray((1,), dtype = numpy.uint64, buffer = self.shm.buf, offset = self.COUNTER)
+		self.sampletime = numpy.ndarray((1,), dtype = numpy.float64, buffer = self.shm.buf, offset = self.SAMPLETIME)
+		self.errors = numpy.ndarray((self.maxErrors,), dtype = numpy.int32, buffer = self.shm.buf, offset = self.ERRORS)
+
+	def close(self):
+		""" Detach from the shared memory region, removing it if we created it """
+
+		# The views must go first, or the region cannot be closed
+		self.counter = None
+		self.sampletime = None
+		self.errors = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+# futex - sleep on, and wake on, a 32bit word in shared memory.
+# Copyright (C) 2018  John Snowdon
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Use as follows:
+#
+# from libs import futex
+#
+# address = futex.address(shm.buf, offset)
+# futex.wait(address, expected, timeout = 0.5) # sleeps while *address == expected
+# futex.wake(address)
+#
+# On Linux this is the futex(2) system call, on macOS the equivalent
+# __ulock_wait/__ulock_wake calls. Both are used in their *shared* form,
+# since the word lives in memory mapped by several processes. Anywhere
+# else (e.g. Windows, where WaitOnAddress only works within one process)
+# wait() simply sleeps for a short while and wake() does nothing. The same
+# fallback is used from then on if a system call ever fails outright.
+
+# Standard libraries
+import ctypes
+import ctypes.util
+import errno
+import platform
+import time
+import sys
+import os
+
+# Settings file
+from libs import settings
+
+# Start a new logger
+from libs.newlog import newlog
+if getattr(sys, 'frozen', False):
+	__file__ = os.path.dirname(sys.executable)
+logger = newlog(__file__)
+
+# futex(2) operations - not the _PRIVATE variants, as those only work
+# between threads of one process
+FUTEX_WAIT = 0
+FUTEX_WAKE = 1
+
+# futex(2) system call numbers, by machine and by the pointer size of this
+# process - platform.machine() names the kernel, so a 32bit userland on a
+# 64bit kernel (e.g. Raspberry Pi OS) must use the 32bit number
+SYS_FUTEX = {
+	('x86_64', 8) 	: 202,
+	('x86_64', 4) 	: 240,
+	('aarch64', 8) 	: 98,
+	('aarch64', 4) 	: 240,
+	('armv6l', 4) 	: 240,
+	('armv7l', 4) 	: 240,
+	('armv8l', 4) 	: 240,
+	('i386', 4) 	: 240,
+	('i686', 4) 	: 240,
+}
+
+# Failures of a wait that just mean it is over, rather than that it can't work
+WAIT_ERRNOS = (errno.EAGAIN, errno.EINTR, errno.ETIMEDOUT)
+
+# __ulock_wait/__ulock_wake operation for a word shared between processes
+UL_COMPARE_AND_WAIT_SHARED = 3
+ULF_WAKE_ALL = 0x100
+
+class timespec(ctypes.Structure):
+	_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+def _setup():
+	""" Find the wait/wake system calls for this platform """
+
+	abi = (platform.machine(), ctypes.sizeof(ctypes.c_void_p))
+	try:
+		if sys.platform.startswith('linux') and (abi in SYS_FUTEX.keys()):
+			libc = ctypes.CDLL(None, use_errno = True)
+			libc.syscall.restype = ctypes.c_long
+			return 'linux', libc, SYS_FUTEX[abi]
+		if sys.platform == 'darwin':
+			libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+			libc.__ulock_wait.argtypes = [ctypes.c_uint32, ctypes.c_void_p, ctypes.c_uint64, ctypes.c_uint32]
+			libc.__ulock_wake.argtypes = [ctypes.c_uint32, ctypes.c_void_p, ctypes.c_uint64]
+			return 'darwin', libc, None
+	except Exception as e:
+		logger.warning("Unable to load futex support, falling back to timed sleeps")
+		logger.warning("%s" % e)
+	return None, None, None
+
+FUTEX_MODE, _libc, _sys_futex = _setup()
+
+def address(buf, offset = 0):
+	""" Return the memory address of byte 'offset' of a writeable buffer.
+
+	The address stays valid for as long as the underlying memory is
+	mapped, but no reference to the buffer is kept, so it can still be
+	closed normally.
+	"""
+
+	c = ctypes.c_char.from_buffer(buf, offset)
+	a = ctypes.addressof(c)
+	del c
+	return a
+
+def _failed(call):
+	""" Give up on futex support for good if a system call failed for any reason other than the wait ending """
+
+	global FUTEX_MODE
+
+	err = ctypes.get_errno()
+	if err in WAIT_ERRNOS:
+		return
+	logger.warning("%s failed [errno=%s], falling back to timed sleeps" % (call, errno.errorcode.get(err, err)))
+	FUTEX_MODE = None
+
+def wait(address, expected = 0, timeout = 1.0):
+	""" Sleep until woken, or for at most 'timeout' seconds, unless the 32bit word at 'address' is no longer 'expected'.
+
+	Without futex support this is a plain sleep of no more than
+	settings.FUTEX_FALLBACK_SLEEP, so that callers still notice new
+	messages promptly.
+	"""
+
+	if FUTEX_MODE == 'linux':
+		ts = timespec(int(timeout), int((timeout % 1) * 1000000000))
+		if _libc.syscall(_sys_futex, ctypes.c_void_p(address), FUTEX_WAIT, ctypes.c_uint32(expected), ctypes.byref(ts), None, 0) == -1:
+			_failed('futex(FUTEX_WAIT)')
+	elif FUTEX_MODE == 'darwin':
+		if _libc.__ulock_wait(UL_COMPARE_AND_WAIT_SHARED, address, expected, max(1, int(timeout * 1000000))) == -1:
+			_failed('__ulock_wait')
+	else:
+		time.sleep(min(timeout, settings.FUTEX_FALLBACK_SLEEP))
+
+def wake(address, count = 1):
+	""" Wake up to 'count' processes sleeping on the 32bit word at 'address' """
+
+	if FUTEX_MODE == 'linux':
+		if _libc.syscall(_sys_futex, ctypes.c_void_p(address), FUTEX_WAKE, count, None, None, 0) == -1:
+			_failed('futex(FUTEX_WAKE)')
+	elif FUTEX_MODE == 'darwin':
+		if count > 1:
+			_libc.__ulock_wake(UL_COMPARE_AND_WAIT_SHARED | ULF_WAKE_ALL, address, 0)
+		else:
+			_libc.__ulock_wake(UL_COMPARE_AND_WAIT_SHARED, address, 0)
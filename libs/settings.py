@@ -23,9 +23,17 @@
 #
 ##############################################################
 
-# Total amount of time the main process sleeps until trying to load data from the
-# receiving queue
-MAIN_SLEEP_TIME = 0.02
+# Longest time the main process sleeps waiting for new control messages to
+# pass on to the workers - it is woken as soon as one arrives
+MAIN_SLEEP_TIME = 0.5
+
+# Where futex wake ups aren't available (or stop working) every wait for a
+# message is a plain sleep, so it is cut down to this many seconds at most
+FUTEX_FALLBACK_SLEEP = 0.02
+
+# Most control messages the main process passes on each time it wakes, so
+# that a flood of messages cannot hold up the rest of the loop
+MAIN_BATCH_MAX = 64
 
 # Maximum number of errors that can be retrieved and buffered
 MAX_ERRORS = 255
@@ -55,6 +63,28 @@ USE_GEAR_INDICATOR = True	# Try to read gear indicator position via GPIO
 USE_COSWORTH = True 		# Try to connect to a Cosworth L8/P8 ECU
 USE_SENSOR_DEMO = False 	# Enable demo data mode from the SensorIO module instead of real data
 
+# Inter-process communication
+USE_SHARED_RINGS = True		# Pass samples and control messages through shared memory rings, rather than multiprocessing queues
+USE_CPU_PINNING = True		# Keep the busiest processes on their own CPU cores (Linux only), see WORKER_CORES
+
+# Which CPU core each process is kept on, when USE_CPU_PINNING is set. Keeping
+# the producer and consumers of the shared rings on fixed cores stops their
+# cache lines bouncing around as the processes migrate. Core numbers count
+# through the cores PyCosworth is allowed to run on, wrapping round if there
+# are fewer of those than listed here; processes not listed are free to run
+# anywhere.
+WORKER_CORES = {
+	'main'		: 0,
+	'SensorIO'	: 1,
+	'GraphicsIO'	: 2,
+	'MatrixIO'	: 3,
+	'ConsoleIO'	: 3,
+}
+
+# Scheduling priority (nice value) of the SensorIO process, lower is more
+# favoured. Raising priority needs root, or CAP_SYS_NICE, so it is only tried.
+SENSORIO_PRIORITY = -5
+
 # Should INFO category messages be shown
 INFO = True
 DEBUG = False
@@ -96,12 +126,32 @@ SENSORS = [
 SENSOR_IDS = []
 for s in SENSORS:
 	SENSOR_IDS.append(s['sensorId'])
+
+# The position of each sensor id in the list above - sensor samples passed
+# between processes carry this index rather than the id itself
+SENSOR_IDX = {}
+for idx, sensorId in enumerate(SENSOR_IDS):
+	SENSOR_IDX[sensorId] = idx
 	
 # How many previous sensor samples, for each sensor, to keep in memory
 SENSOR_MAX_HISTORY = 256
 
-# The amount of time, in seconds, that the SensorIO process sleeps between each loop
-SENSOR_SLEEP_TIME = 0.05
+# The SensorIO process sleeps until the next sensor is due to be read, but never for
+# longer than this many seconds at a time. A control message wakes it early anyway.
+CONTROL_POLL_MAX = 0.25
+
+# How long, in seconds, the SensorIO process sleeps while waiting for the reply
+# to an outstanding serial request. One byte each way at 1952 baud is ~10ms.
+SENSOR_POLL_TIME = 0.005
+
+# How many sensor samples the shared memory ring between processes can hold
+# before the oldest are overwritten. Must be a power of two.
+SENSOR_RING_SIZE = 1024
+
+# How many worker processes can read from the sensor sample ring. Each worker
+# uses its BUTTON_DEST_* id (below) as its consumer id, so this must be at least
+# as large as the highest of those.
+SENSOR_RING_CONSUMERS = 8
 
 ##########################################################
 #
@@ -272,7 +322,7 @@ MATRIX_CONFIG = {
 #######################################################
 
 # The number of steps between the minValue and the maxValue of a
-# sensor to simulate.
+# sensor to simulate. Rounded up to a power of two if it isn't one.
 DEMO_STEPS = 64
 
 #######################################################
@@ -286,6 +336,15 @@ DEMO_STEPS = 64
 # How long to sleep between button scans
 GPIO_SLEEP_TIME = 0.2
 
+# How many control messages can be waiting for any one worker process
+# before new ones are dropped. Must be a power of two.
+CONTROL_RING_SIZE = 64
+
+# How many worker processes can read from the control message ring. As with
+# SENSOR_RING_CONSUMERS, each worker uses its BUTTON_DEST_* id (below) as its
+# consumer id, so this must be at least as large as the highest of those.
+CONTROL_RING_CONSUMERS = 8
+
 # Length of time each press takes (min time, max time)
 BUTTON_TIME_SHORT 	= (0, 	0.3)
 BUTTON_TIME_MEDIUM 	= (0.5, 1.0)